@@ -13,17 +13,43 @@ Commenter(s): Ivan Costa Neto
 Last Updated: Nov. 16, 2024
 """
 
+import math
+import os
+import numpy as np
+
+os.environ.setdefault("PYGAME_VSYNC", "1")  # request vsync on older pygame versions
+
 import pygame
-import time
 
 # initialize Pygame
 pygame.init()
 
 # full-screen setup
-screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)  # fullscreen mode
+# SCALED goes through the SDL renderer, which is what allows flip() to block on vblank
+display_info = pygame.display.Info()
+display_size = (display_info.current_w, display_info.current_h)
+try:
+    screen = pygame.display.set_mode(
+        display_size, pygame.FULLSCREEN | pygame.SCALED, vsync=1
+    )  # fullscreen mode, locked to the display refresh
+except pygame.error:
+    screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)  # fullscreen mode
 screen_width, screen_height = screen.get_size()  # get screen dimensions
 pygame.display.set_caption("SSVEP Chess WASD Movement Flashing Boxes")
 
+
+# display refresh rate in frames per second, queried once the display mode is set
+def get_refresh_rate(default=60):
+    try:
+        rate = pygame.display.get_current_refresh_rate()  # pygame-ce 2.5+
+    except (AttributeError, pygame.error):
+        try:
+            rate = pygame.display.get_desktop_refresh_rates()[0]  # pygame 2.2+
+        except (AttributeError, IndexError, pygame.error):
+            rate = 0
+    return rate if rate > 0 else default  # 0 --> refresh rate unknown to SDL
+
+
 # colors
 white = (255, 255, 255)
 black = (0, 0, 0)
@@ -37,78 +63,103 @@ box_height = 200
 spacing_multiplier = 1.8  # multiplies the gap between boxes (prevent peripheral vision in EEG data)
 gap = box_width * spacing_multiplier
 
+# keys of the boxes (chess directions), every per-box table below is a parallel tuple indexed 0..3
+keys = ("W", "A", "S", "D")
+box_indices = range(len(keys))
+
 # positioning boxes for W, A, S, D (chess directions)
-positions = {
-    "W": ((screen_width - box_width) // 2, (screen_height - box_height) // 1.3 - gap),  # up
-    "A": ((screen_width - box_width) // 2 - gap, (screen_height - box_height) // 1.3),  # left
-    "S": ((screen_width - box_width) // 2, (screen_height - box_height) // 1.3),  # down
-    "D": ((screen_width - box_width) // 2 + gap, (screen_height - box_height) // 1.3)  # right
-}
+positions = (
+    ((screen_width - box_width) // 2, (screen_height - box_height) // 1.3 - gap),  # up
+    ((screen_width - box_width) // 2 - gap, (screen_height - box_height) // 1.3),  # left
+    ((screen_width - box_width) // 2, (screen_height - box_height) // 1.3),  # down
+    ((screen_width - box_width) // 2 + gap, (screen_height - box_height) // 1.3),  # right
+)
 
 # frequencies for each box (in Hz)
-frequencies = {
-    "W": 6.66,  # up: 4 Hz
-    "A": 7.5,  # left: 8 Hz
-    "S": 8.57,  # down: 12 Hz
-    "D": 10  # right: 16 Hz
-}
+frequencies = (
+    6.66,  # up: 4 Hz
+    7.5,  # left: 8 Hz
+    8.57,  # down: 12 Hz
+    10,  # right: 16 Hz
+)
 
 # directional labels
-labels = {
-    "W": "Up",
-    "A": "Left",
-    "S": "Down",
-    "D": "Right"
-}
+labels = ("Up", "Left", "Down", "Right")
+
+# display refresh rate the flicker schedule is built for (frames per second)
+# every frame is shown for one refresh, so the schedule must count real display frames
+fps = get_refresh_rate()
+
+# number of frames in one full on/off cycle for each box (e.g. 10 Hz --> 6 frames at 60 Hz)
+cycle_frames = tuple(max(2, round(fps / freq)) for freq in frequencies)
+
+# the schedule repeats after the least common multiple of all cycle lengths
+period = math.lcm(*cycle_frames)
 
-# state of each box (on/off) and their last toggle times
-states = {key: False for key in positions}
-last_toggle_times = {key: time.time() for key in positions}
+# precomputed on/off pattern for each box, indexed by the frame counter
+# (stored as plain bools so a state can index the (off, on) surface pair directly)
+schedule = tuple(
+    ((np.arange(period) * 2 // cycle) % 2 == 1).tolist() for cycle in cycle_frames
+)
+
+# box rectangles never change, so build them once
+box_rects = tuple(
+    pygame.Rect(int(x), int(y), box_width, box_height) for x, y in positions
+)
+
+
+# pre-renders one box (fill, border and label) so a frame only needs a single blit per box
+def render_box(idx, fill):
+    surface = pygame.Surface((box_width, box_height)).convert()
+    surface.fill(fill)  # flashing box
+    pygame.draw.rect(surface, white, surface.get_rect(), 5)  # border for all boxes
+    label_surface = font.render(labels[idx], True, black)  # text label with black font
+    surface.blit(label_surface, label_surface.get_rect(center=surface.get_rect().center))
+    return surface
+
+
+# (off, on) surfaces for each box, indexed by its state
+box_surfaces = tuple((render_box(idx, black), render_box(idx, white)) for idx in box_indices)
+
+
+# state of each box (on/off) and the current frame within the schedule
+states = [False] * len(keys)
+frame = 0
+
+# fill the screen with black and draw every box once, later frames only redraw changed boxes
+screen.fill(black)
+screen.blits([(box_surfaces[idx][states[idx]], box_rects[idx]) for idx in box_indices])
+pygame.display.flip()
 
 # main loop
 running = True
 clock = pygame.time.Clock()
 
 while running:
-    current_time = time.time()
-
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             running = False
         if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:  # exit on Esc key
             running = False
 
-    # update flashing states based on frequencies
-    for key in positions:
-        interval = 1 / (2 * frequencies[key])  # time for one on/off cycle
-        if current_time - last_toggle_times[key] >= interval:
-            states[key] = not states[key]  # toggle state
-            last_toggle_times[key] = current_time  # reset toggle time
-
-    # fill the screen with black
-    screen.fill(black)
-
-    # draw the boxes based on their states
-    for key, pos in positions.items():
-        # draw flashing box
-        if states[key]:  # box is "on"
-            pygame.draw.rect(screen, white, (*pos, box_width, box_height), 0)
-        else:  # box is "off"
-            pygame.draw.rect(screen, black, (*pos, box_width, box_height), 0)
-
-        # draw border for all boxes
-        pygame.draw.rect(screen, white, (*pos, box_width, box_height), 5)
-
-        # add text label with black font
-        label_surface = font.render(labels[key], True, black)
-        label_rect = label_surface.get_rect(center=(pos[0] + box_width // 2, pos[1] + box_height // 2))
-        screen.blit(label_surface, label_rect)
-
-    # update the display
-    pygame.display.flip()
-
-    # limit frame rate
-    clock.tick(60)
+    # update flashing states from the precomputed schedule, redrawing only the boxes that toggled
+    frame = (frame + 1) % period
+    changed = []
+    dirty_rects = []
+    for idx in box_indices:
+        state = schedule[idx][frame]
+        if state != states[idx]:
+            states[idx] = state
+            rect = box_rects[idx]
+            changed.append((box_surfaces[idx][state], rect))
+            dirty_rects.append(rect)
+    screen.blits(changed, doreturn=False)  # one batched draw call for all toggled boxes
+
+    # update the changed regions of the display (blocks until the next vblank when vsync is enabled)
+    pygame.display.update(dirty_rects)
+
+    # limit the frame rate to the refresh rate, vsync may be ignored by the driver without an error
+    clock.tick(fps)
 
 # quit Pygame
 pygame.quit()
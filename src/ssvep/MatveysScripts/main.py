@@ -16,10 +16,12 @@ Last Updated: Nov. 15, 2024
 import argparse
 import logging
 import time
+import numpy as np
 import pyqtgraph as pg  #real-time data visualization
 from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds  #interacts with Knight board
-from brainflow.data_filter import DataFilter, FilterTypes, DetrendOperations  #preprocessing tools (i.e. filtering)
 from pyqtgraph.Qt import QtGui, QtCore  #graphical interface
+from scipy import signal  #preprocessing tools (i.e. filtering)
+from ring_buffer import RingBuffer  #preallocated sliding window of the streamed samples
 
 # initializes the EEG graphing tool with parameters from the connected Knight board
 class Graph:
@@ -31,9 +33,24 @@ class Graph:
         self.update_speed_ms = 50  #graph updates every 50 ms
         self.window_size = 4  #displays data window of 4 s
         self.num_points = self.window_size * self.sampling_rate  #total data points displayed
+        self.ring = RingBuffer(len(self.exg_channels), self.num_points)  #latest window of the EEG channels only
+        self.channel_spacing = 100.0  #vertical offset b/w stacked channels (uV)
+        self.channel_offsets = self.channel_spacing * np.arange(len(self.exg_channels))[::-1, None]  #first channel on top
+        self._alloc_stacked(self.num_points)
+
+        # designs the preprocessing filters once as second-order sections, chained into a single cascade
+        # (zero-phase when applied with sosfiltfilt, one forward-backward pass for all three filters)
+        self.sos_filter = np.vstack([
+            signal.butter(2, [3.0, 45.0], btype='bandpass', fs=self.sampling_rate,
+                          output='sos'),  #frequencies b/w 3-45 Hz (alpha, beta, low gamma bands)
+            signal.butter(2, [48.0, 52.0], btype='bandstop', fs=self.sampling_rate,
+                          output='sos'),  #notch filter (removes 48-52 Hz)
+            signal.butter(2, [58.0, 62.0], btype='bandstop', fs=self.sampling_rate,
+                          output='sos'),  #notch filter (removes 58-62 Hz)
+        ])
 
         # sets up the GUI application window
-        self.app = QtGui.QApplication([])
+        self.app = pg.mkQApp()
         self.win = pg.GraphicsWindow(title='BrainFlow Plot', size=(800, 600))
 
         # initialize the graph
@@ -41,46 +58,49 @@ class Graph:
 
         # loops the GUI setup with a refreshing graph
         timer = QtCore.QTimer()
+        timer.setTimerType(QtCore.Qt.PreciseTimer)  #keeps the 50 ms period from drifting (coarse timers are ~16 ms granular on Windows)
         timer.timeout.connect(self.update)
         timer.start(self.update_speed_ms)
         QtGui.QApplication.instance().exec_()
 
-    # creates a row of plots for each EEG channel connected
+    # creates a single plot showing every EEG channel connected, stacked vertically
     def _init_timeseries(self):
-        self.plots = list()  #individual plots for each channel
-        self.curves = list()  #graphical curves corresponding to the continuous data
-
-        # iterates through each avaliable channel and initializates a time-series graph setup
-        for i in range(len(self.exg_channels)):
-            p = self.win.addPlot(row=i, col=0)
-            p.showAxis('left', False)
-            p.setMenuEnabled('left', False)
-            p.showAxis('bottom', False)
-            p.setMenuEnabled('bottom', False)
-            if i == 0:
-                p.setTitle('TimeSeries Plot')
-            self.plots.append(p)
-            curve = p.plot()
-            self.curves.append(curve)
+        self.plot = self.win.addPlot(row=0, col=0)
+        self.plot.showAxis('left', False)
+        self.plot.setMenuEnabled('left', False)
+        self.plot.showAxis('bottom', False)
+        self.plot.setMenuEnabled('bottom', False)
+        self.plot.setTitle('TimeSeries Plot')
+
+        # one curve for all channels, the NaN samples b/w channels split it into separate lines
+        self.curve = self.plot.plot(connect='finite')
+
+    # preallocates the [channels, samples + 1] stacked buffer, the extra NaN column separates the channels
+    def _alloc_stacked(self, num_samples):
+        n_channels = len(self.exg_channels)
+        self.stacked = np.full((n_channels, num_samples + 1), np.nan)
+        x_axis = np.full(num_samples + 1, np.nan)
+        x_axis[:num_samples] = np.arange(num_samples)  #sample indices, repeated for every channel
+        self.stacked_x = np.tile(x_axis, n_channels)
 
     # fetches the latest EEG data and updates the graph in real-time (with filtering)
     def update(self):
-        data = self.board_shim.get_current_board_data(self.num_points)  #latest EEG data
-
-        # iterates through each avaliable channel
-        for count, channel in enumerate(self.exg_channels):
-            # plot timeseries with preprocessing tools
-            DataFilter.detrend(data[channel], DetrendOperations.CONSTANT.value)  #removes linear/constant signal trends
-            DataFilter.perform_bandpass(data[channel], self.sampling_rate, 3.0, 45.0, 2,
-                                        FilterTypes.BUTTERWORTH_ZERO_PHASE, 0)  #frequencies b/w 3-45 Hz (alpha, beta, low gamma bands)
-            DataFilter.perform_bandstop(data[channel], self.sampling_rate, 48.0, 52.0, 2,
-                                        FilterTypes.BUTTERWORTH_ZERO_PHASE, 0)  #notch filter (removes 48-52 Hz)
-            DataFilter.perform_bandstop(data[channel], self.sampling_rate, 58.0, 62.0, 2,
-                                        FilterTypes.BUTTERWORTH_ZERO_PHASE, 0)  #notch filter (removes 58-62 Hz)
-            self.curves[count].setData(data[channel].tolist())
-
-        # processes pending events, refreshing the display in real-time
-        self.app.processEvents()
+        # moves only the samples that arrived since the last tick into the ring buffer
+        self.ring.extend(self.board_shim.get_board_data()[self.exg_channels])
+        if self.ring.count < self.sampling_rate:
+            return  #waits for at least 1 s of data, the filters need more samples than their edge padding
+
+        # preprocesses all channels at once as a [channels, samples] block
+        data = self.ring.window()[:, -self.ring.count:]  #latest EEG data (view, oldest sample first)
+        eeg = signal.detrend(data, axis=1, type='constant')  #removes constant signal trends
+        eeg = signal.sosfiltfilt(self.sos_filter, eeg, axis=1)  #bandpass + both notches in one pass
+
+        # plot timeseries of each avaliable channel with a single setData call
+        num_samples = eeg.shape[1]
+        if self.stacked.shape[1] != num_samples + 1:
+            self._alloc_stacked(num_samples)  #only while the first window is still filling up
+        np.add(eeg, self.channel_offsets, out=self.stacked[:, :num_samples])
+        self.curve.setData(self.stacked_x, self.stacked.ravel())
 
 # establishes a connection with the Knight board using preset parameters and serial port 
 def initialize_connection(port = "COM3", channels = range(9), gain_values = [12] * 8) -> BoardShim:
@@ -100,7 +120,8 @@ def initialize_connection(port = "COM3", channels = range(9), gain_values = [12]
     for i in range(len(channels)):
         board_shim.config_board(f"chon_{channels[i]}_{gain_values[i]}")
         print(f"Connected channel {channels[i]} with gain {gain_values[i]}")
-        time.sleep(0.5)
+        time.sleep(0.05)  # short gap so the board doesn't drop back-to-back commands
+    time.sleep(0.2)  # single settle delay once every channel is configured
 
     # returns instance of BoardShim class along with the board, parameters, and accessable channels
     return board_shim
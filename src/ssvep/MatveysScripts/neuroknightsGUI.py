@@ -4,19 +4,38 @@ import time
 import numpy as np
 import pyqtgraph as pg
 from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
-from brainflow.data_filter import DataFilter, FilterTypes, DetrendOperations
-from enum import Enum  # Import Enum for WindowFunctions
 from pyqtgraph.Qt import QtGui, QtCore
+from scipy import signal
 import serial.tools.list_ports
-from functools import partial
+from functools import lru_cache, partial
+from ring_buffer import RingBuffer
 
+# Render plots through OpenGL and skip antialiasing, the live curves are redrawn every tick
+pg.setConfigOptions(useOpenGL=True, enableExperimental=True, antialias=False)
 
-# Define WindowFunctions Enum
-class WindowFunctions(Enum):
-    NO_WINDOW = 0
-    HANNING = 1
-    HAMMING = 2
-    BLACKMAN_HARRIS = 3
+# Flicker frequencies of the W/A/S/D boxes in ConfigurableFlasher-v2.py (Hz)
+SSVEP_TARGET_FREQS = (6.66, 7.5, 8.57, 10.0)
+
+
+# Board descriptions are constant, so each BrainFlow lookup is done once per board id
+@lru_cache(maxsize=None)
+def _exg_channels(board_id):
+    return tuple(BoardShim.get_exg_channels(board_id))
+
+
+@lru_cache(maxsize=None)
+def _sampling_rate(board_id):
+    return BoardShim.get_sampling_rate(board_id)
+
+
+@lru_cache(maxsize=None)
+def _num_rows(board_id):
+    return BoardShim.get_num_rows(board_id)
+
+
+@lru_cache(maxsize=None)
+def _marker_channel(board_id):
+    return BoardShim.get_marker_channel(board_id)
 
 
 class Graph:
@@ -25,12 +44,17 @@ class Graph:
         self.board_id = None
         self.exg_channels = []
         self.sampling_rate = None
-        self.update_speed_ms = 50
+        self.filter_speed_ms = 50  # Board reads into the ring buffer
+        self.update_speed_ms = 200  # Spectrum and plot refresh
         self.window_size = 4
         self.num_points = None
         self.mode = "SSVEP"  # Default mode
+        self.latest_data = None
+        self._active_indices = []  # Checked channels that map to a board row
+        self.target_freqs = np.array(SSVEP_TARGET_FREQS)
+        self.show_full_spectrum = False  # Plot the full Welch PSD instead of the target scores
 
-        self.app = QtGui.QApplication([])
+        self.app = pg.mkQApp()
         self.win = QtGui.QWidget()
         self.win.setWindowTitle("BrainFlow Plot")
         self.win.resize(1000, 800)
@@ -61,6 +85,10 @@ class Graph:
             p = self.graph_layout_widget.addPlot(row=i, col=0)
             if i == 0:
                 p.setTitle("TimeSeries Plot")
+            # Only draw visible points, reduced to about one peak per pixel column
+            p.setDownsampling(auto=True, mode="peak")
+            p.setClipToView(True)
+            p.setVisible(False)  # Shown once its channel is checked
             self.plots.append(p)
             curve = p.plot()
             self.curves.append(curve)
@@ -95,6 +123,12 @@ class Graph:
         mode_layout.addWidget(self.mode_combo)
         self.controls_layout.addLayout(mode_layout)
 
+        # Full Welch PSD debug view (the target scores are much cheaper and the default)
+        self.full_spectrum_checkbox = QtGui.QCheckBox("Full Spectrum (Welch PSD)")
+        self.full_spectrum_checkbox.setChecked(self.show_full_spectrum)
+        self.full_spectrum_checkbox.stateChanged.connect(self.full_spectrum_changed)
+        self.controls_layout.addWidget(self.full_spectrum_checkbox)
+
         # COM Port Dropdown
         com_port_label = QtGui.QLabel("COM Port:")
         self.com_port_combo = QtGui.QComboBox()
@@ -156,177 +190,150 @@ class Graph:
             self.ssvep_plot.setLabel("left", "Voltage (µV)")
             self.ssvep_plot.setLabel("bottom", "Time (ms)")
             # Reset P300 epochs
-            self.p300_epochs = [[] for _ in range(8)]
+            self.reset_p300_epochs()
         else:
             self.ssvep_plot.setTitle("SSVEP Frequency Spectrum")
             self.ssvep_plot.setLabel("left", "Intensity")
             self.ssvep_plot.setLabel("bottom", "Frequency (Hz)")
 
+    def full_spectrum_changed(self, state):
+        self.show_full_spectrum = self.full_spectrum_checkbox.isChecked()
+
     def update(self):
+        """Fast timer: pulls the new samples from the board into the ring buffer."""
         if self.board_shim is None:
             return  # Do nothing if the board is not connected
 
-        # Get the latest data from the board
-        data = self.board_shim.get_current_board_data(self.num_points)
+        # Move only the samples that arrived since the last tick into the ring buffer
+        self.ring.extend(self.board_shim.get_board_data())
+
+        if not self.ring.is_full():
+            # Not enough data collected yet
+            self.latest_data = None
+            return
+
+        # Filtering is left to replot(), which is the only consumer of the window
+        self.latest_data = self.ring.window()
+
+    def replot(self):
+        """Slow timer: computes the spectrum/ERP and refreshes the plots."""
+        if self.board_shim is None:
+            return  # Do nothing if the board is not connected
 
-        if data.shape[1] < self.num_points:
+        if self.latest_data is None:
             # Not enough data collected yet
-            for i in range(8):
+            for i in self._active_indices:
                 self.curves[i].setData([])
                 self.peak_freq_labels[i].setText("Collecting data...")
             return
 
         if self.mode == "SSVEP":
-            self.process_ssvep_data(data)
+            self.process_ssvep_data(self.latest_data)
         elif self.mode == "P300":
-            self.process_p300_data(data)
+            self.process_p300_data(self.latest_data)
+
+    def filter_ssvep_data(self, data):
+        # Filter all active channels at once as a single [channels, samples] block
+        active = self._active_indices
+        filtered = None
+        if active:
+            filtered = np.ascontiguousarray(
+                data[[self.channel_to_data_index[i] for i in active]],
+                dtype=np.float64,
+            )
+            filtered = signal.detrend(filtered, axis=1, type="constant")
+            filtered = signal.sosfiltfilt(self.sos_filter, filtered, axis=1)
 
-        self.app.processEvents()
+        return active, filtered
 
     def process_ssvep_data(self, data):
-        psd_list = []
-        freqs = None
-        for i in range(8):  # For channels 0 to 7
-            if self.channel_checkboxes[i].isChecked():
-                data_index = self.channel_to_data_index.get(i, None)
-                if data_index is not None:
-                    # Get channel data
-                    channel_data = data[data_index]
-                    channel_data = np.asarray(
-                        channel_data, dtype=np.float64
-                    )  # Ensure correct type
-
-                    # Ensure we have enough data
-                    if len(channel_data) < 8:
-                        # Skip processing if not enough data
-                        self.curves[i].setData([])
-                        self.peak_freq_labels[i].setText("Collecting data...")
-                        continue
-
-                    # Process and plot data
-                    DataFilter.detrend(channel_data, DetrendOperations.CONSTANT.value)
-                    DataFilter.perform_bandpass(
-                        channel_data,
-                        int(self.sampling_rate),
-                        3.0,
-                        45.0,
-                        2,
-                        FilterTypes.BUTTERWORTH_ZERO_PHASE.value,
-                        0,
-                    )
-                    DataFilter.perform_bandstop(
-                        channel_data,
-                        int(self.sampling_rate),
-                        48.0,
-                        52.0,
-                        2,
-                        FilterTypes.BUTTERWORTH_ZERO_PHASE.value,
-                        0,
-                    )
-                    DataFilter.perform_bandstop(
-                        channel_data,
-                        int(self.sampling_rate),
-                        58.0,
-                        62.0,
-                        2,
-                        FilterTypes.BUTTERWORTH_ZERO_PHASE.value,
-                        0,
-                    )
-                    self.curves[i].setData(channel_data.tolist())
-
-                    nfft = 2 ** int(math.floor(math.log2(len(channel_data))))
-                    if nfft < 8:
-                        self.peak_freq_labels[i].setText("Collecting data...")
-                        continue
-
-                    overlap_samples = nfft // 2  # For 50% overlap
-
-                    psd_data = DataFilter.get_psd_welch(
-                        channel_data,
-                        nfft=nfft,
-                        overlap=overlap_samples,
-                        sampling_rate=int(self.sampling_rate),
-                        window=WindowFunctions.HAMMING.value,
-                    )
-                    # Get frequencies and power
-                    power = psd_data[0]
-                    freqs = psd_data[1]
-                    psd_list.append(power)
-
-                    # Find peak frequency in a specified range (e.g., 5-20 Hz)
-                    freq_range = (freqs >= 5) & (freqs <= 20)
-                    if np.any(freq_range):
-                        peak_freq_index = np.argmax(power[freq_range])
-                        peak_freq = freqs[freq_range][peak_freq_index]
-                        peak_power = power[freq_range][peak_freq_index]
-
-                        # Display peak frequency
-                        self.peak_freq_labels[i].setText(
-                            f"Peak Freq: {peak_freq:.2f} Hz"
-                        )
-                    else:
-                        self.peak_freq_labels[i].setText("No Peak")
-                else:
-                    # Data index not available
-                    self.curves[i].setData([])
-                    self.peak_freq_labels[i].setText("")
-            else:
-                # Clear the plot and peak frequency for this channel
-                self.curves[i].setData([])
-                self.peak_freq_labels[i].setText("")
+        active, filtered = self.filter_ssvep_data(data)
 
-        # Aggregate PSDs and update SSVEP plot
-        if psd_list and freqs is not None:
-            avg_psd = np.mean(psd_list, axis=0)
-            self.ssvep_curve.setData(freqs, avg_psd)
-        else:
+        if not active:
             # No active channels or no data, clear the SSVEP plot
             self.ssvep_curve.setData([], [])
+            return
+
+        if self.show_full_spectrum:
+            # Welch PSD (Hamming window, 50% overlap) of all active channels in one call
+            _, psd = signal.welch(
+                filtered,
+                fs=self.sampling_rate,
+                window=self.psd_window,
+                nperseg=self.nfft,
+                noverlap=self.overlap_samples,
+                detrend=False,
+                axis=1,
+            )
+
+            # Find peak frequency of every channel in a specified range (e.g., 5-20 Hz)
+            lo, hi = self.freq_lo_idx, self.freq_hi_idx
+            if hi > lo:
+                peak_freqs = self.freqs[lo + np.argmax(psd[:, lo:hi], axis=1)]
+            else:
+                peak_freqs = None
+            spectrum_freqs, spectrum = self.freqs, psd.mean(axis=0)
+        else:
+            # Power at each flicker frequency and its 2nd harmonic for all active channels
+            # (shape: [channels, 2 * targets]), only the bins we care about instead of a full PSD
+            power = np.abs(filtered @ self.target_basis) ** 2
+            n_targets = len(self.target_freqs)
+            scores = power[:, :n_targets] + power[:, n_targets:]
+            peak_freqs = self.target_freqs[np.argmax(scores, axis=1)]
+            spectrum_freqs, spectrum = self.target_freqs, scores.mean(axis=0)
+
+        # Inactive channels are hidden, so only the active plots are refreshed
+        for row, i in enumerate(active):
+            # Plot filtered data and display peak frequency
+            self.curves[i].setData(self.x_axis, filtered[row])
+            if peak_freqs is not None:
+                self.peak_freq_labels[i].setText(f"Peak Freq: {peak_freqs[row]:.2f} Hz")
+            else:
+                self.peak_freq_labels[i].setText("No Peak")
+
+        # Aggregate over the active channels and update SSVEP plot
+        self.ssvep_curve.setData(spectrum_freqs, spectrum)
 
     def process_p300_data(self, data):
         marker_data = data[self.marker_channel].astype(int)
-        # Find indices where marker is set
-        event_indices = np.where(marker_data != 0)[0]
-        for i, curve in enumerate(self.curves):
-            if self.channel_checkboxes[i].isChecked():
-                data_index = self.channel_to_data_index.get(i, None)
-                if data_index is not None:
-                    channel_data = data[data_index]
-                    # For each event index, extract an epoch
-                    for event_index in event_indices:
-                        # Define epoch window around event (e.g., -100ms to 400ms)
-                        pre_event_samples = int(0.1 * self.sampling_rate)  # 100ms
-                        post_event_samples = int(0.4 * self.sampling_rate)  # 400ms
-                        start_idx = event_index - pre_event_samples
-                        end_idx = event_index + post_event_samples
-                        # Ensure indices are within data range
-                        if start_idx >= 0 and end_idx <= len(channel_data):
-                            epoch = channel_data[start_idx:end_idx]
-                            # Store the epoch for averaging
-                            if not hasattr(self, "p300_epochs"):
-                                self.p300_epochs = [
-                                    [] for _ in range(8)
-                                ]  # Assuming 8 channels
-                            self.p300_epochs[i].append(epoch)
-                else:
-                    pass  # Data index not available
+        # Find indices where marker is set, keeping events whose whole epoch fits in the data
+        event_indices = np.flatnonzero(marker_data != 0)
+        event_indices = event_indices[
+            (event_indices >= self.pre_event_samples)
+            & (event_indices + self.post_event_samples <= data.shape[1])
+        ]
+        active = self._active_indices
+        if active and event_indices.size:
+            # Gather every epoch of every active channel at once
+            # (shape: [channels, events, epoch_len])
+            rows = np.array([self.channel_to_data_index[i] for i in active])
+            epochs = data[
+                rows[:, None, None],
+                event_indices[None, :, None] + self.p300_offsets[None, None, :],
+            ]
+            # Accumulate the epochs into the running sums for averaging
+            self.p300_sum[active] += epochs.sum(axis=1)
+            self.p300_n[active] += event_indices.size
 
         # After collecting enough epochs, average them
         # Let's define a minimum number of epochs
         min_epochs = 10
-        for i in range(8):
-            if self.channel_checkboxes[i].isChecked() and hasattr(self, "p300_epochs"):
-                if len(self.p300_epochs[i]) >= min_epochs:
-                    # Average the epochs
-                    avg_epoch = np.mean(self.p300_epochs[i], axis=0)
-                    # Plot the averaged epoch
-                    time_axis = np.linspace(-100, 400, len(avg_epoch))  # Time in ms
-                    self.ssvep_curve.setData(time_axis, avg_epoch)
-                    self.p300_epochs[i] = []  # Reset epochs after averaging
-                else:
-                    pass  # Not enough epochs yet
+        for i in active:
+            if self.p300_n[i] >= min_epochs:
+                # Average the epochs
+                avg_epoch = self.p300_sum[i] / self.p300_n[i]
+                # Plot the averaged epoch
+                self.ssvep_curve.setData(self.p300_time_axis, avg_epoch)
+                # Reset epochs after averaging
+                self.p300_sum[i] = 0.0
+                self.p300_n[i] = 0
             else:
-                pass  # Channel not active or no epochs
+                pass  # Not enough epochs yet
+
+    def reset_p300_epochs(self):
+        if self.board_shim is not None:
+            self.p300_sum[:] = 0.0
+            self.p300_n[:] = 0
 
     def detect_stimulus(self):
         # Dummy function to demonstrate stimulus detection, replace with real stimulus logic
@@ -357,9 +364,53 @@ class Graph:
             port=port, channels=channels, gain_values=gain_values
         )
         self.board_id = self.board_shim.get_board_id()
-        self.eeg_channels = BoardShim.get_exg_channels(self.board_id)
-        self.sampling_rate = BoardShim.get_sampling_rate(self.board_id)
+        self.eeg_channels = _exg_channels(self.board_id)
+        self.sampling_rate = _sampling_rate(self.board_id)
         self.num_points = int(self.window_size * self.sampling_rate)
+        self.x_axis = np.arange(self.num_points, dtype=np.float64)
+        self.ring = RingBuffer(_num_rows(self.board_id), self.num_points)
+
+        # Design the preprocessing filters once as second-order sections, chained into a
+        # single cascade so sosfiltfilt makes one forward-backward pass for all three
+        self.sos_filter = np.vstack(
+            [
+                signal.butter(
+                    2, [3.0, 45.0], btype="bandpass", fs=self.sampling_rate, output="sos"
+                ),
+                signal.butter(
+                    2, [48.0, 52.0], btype="bandstop", fs=self.sampling_rate, output="sos"
+                ),
+                signal.butter(
+                    2, [58.0, 62.0], btype="bandstop", fs=self.sampling_rate, output="sos"
+                ),
+            ]
+        )
+
+        # The PSD window length is fixed by num_points, so the Welch setup is computed once
+        self.nfft = 2 ** int(math.floor(math.log2(self.num_points)))
+        self.overlap_samples = self.nfft // 2  # For 50% overlap
+        self.psd_window = signal.get_window("hamming", self.nfft)
+        self.freqs = np.fft.rfftfreq(self.nfft, d=1.0 / self.sampling_rate)
+        # Peak search range (5-20 Hz) as a slice of the sorted frequency bins
+        self.freq_lo_idx = int(np.searchsorted(self.freqs, 5, side="left"))
+        self.freq_hi_idx = int(np.searchsorted(self.freqs, 20, side="right"))
+
+        # Single-bin DFT basis (what a Goertzel filter evaluates) at each flicker frequency
+        # and its 2nd harmonic, Hamming-windowed (shape: [num_points, 2 * targets])
+        t = np.arange(self.num_points) / self.sampling_rate
+        harmonics = np.concatenate([self.target_freqs, 2 * self.target_freqs])
+        self.target_basis = np.ascontiguousarray(
+            (np.hamming(self.num_points) * np.exp(-2j * np.pi * harmonics[:, None] * t)).T
+        )
+
+        # P300 epochs (-100ms to 400ms around each marker) are averaged with a running sum
+        self.pre_event_samples = int(0.1 * self.sampling_rate)  # 100ms
+        self.post_event_samples = int(0.4 * self.sampling_rate)  # 400ms
+        epoch_len = self.pre_event_samples + self.post_event_samples
+        self.p300_sum = np.zeros((8, epoch_len), dtype=np.float64)
+        self.p300_n = np.zeros(8, dtype=int)
+        self.p300_time_axis = np.linspace(-100, 400, epoch_len)  # Time in ms
+        self.p300_offsets = np.arange(-self.pre_event_samples, self.post_event_samples)
 
         # Map channel numbers to data indices
         self.channel_to_data_index = {}
@@ -369,8 +420,10 @@ class Graph:
             else:
                 self.channel_to_data_index[i] = None
 
+        self._update_active_indices()
+
         # Get marker channel index
-        self.marker_channel = BoardShim.get_marker_channel(self.board_id)
+        self.marker_channel = _marker_channel(self.board_id)
 
         # Update the board name label
         self.board_name_label.setText(
@@ -380,13 +433,40 @@ class Graph:
 
         # Start the update loop
         self.timer = QtCore.QTimer()
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)  # Avoid coarse-timer drift on Windows
         self.timer.timeout.connect(self.update)
-        self.timer.start(self.update_speed_ms)
+        self.timer.start(self.filter_speed_ms)
+
+        # Start the plot refresh loop
+        self.plot_timer = QtCore.QTimer()
+        self.plot_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.plot_timer.timeout.connect(self.replot)
+        self.plot_timer.start(self.update_speed_ms)
+
+    def _update_active_indices(self):
+        # Cached so the plot loops don't poll every checkbox on each tick
+        if self.board_shim is None:
+            self._active_indices = []
+            return
+        self._active_indices = [
+            i
+            for i in range(8)
+            if self.channel_checkboxes[i].isChecked()
+            and self.channel_to_data_index.get(i, None) is not None
+        ]
 
     def channel_checkbox_changed(self, index, state):
         channel = index
 
-        if self.channel_checkboxes[index].isChecked():
+        # Hide inactive plots instead of redrawing them empty every tick
+        checked = self.channel_checkboxes[index].isChecked()
+        self.plots[index].setVisible(checked)
+        self.peak_freq_labels[index].setVisible(checked)
+        if not checked:
+            self.curves[index].setData([])
+            self.peak_freq_labels[index].setText("")
+
+        if checked:
             gain_value = int(self.gain_inputs[index].text())
 
             if self.board_shim is None:
@@ -403,6 +483,8 @@ class Graph:
                 self.board_shim.config_board(f"choff_{channel_num}")
                 print(f"Disconnected channel {channel_num}")
 
+        self._update_active_indices()
+
     def gain_value_changed(self, index):
         channel = index
 
@@ -443,7 +525,8 @@ def initialize_connection(port, channels, gain_values) -> BoardShim:
         channel_num = channels[i] + 1  # Add 1 to channel index
         board_shim.config_board(f"chon_{channel_num}_{gain_values[i]}")
         print(f"Connected channel {channel_num} with gain {gain_values[i]}")
-        time.sleep(0.5)
+        time.sleep(0.05)  # Short gap so the board doesn't drop back-to-back commands
+    time.sleep(0.2)  # Single settle delay once every channel is configured
 
     return board_shim
 
@@ -0,0 +1,58 @@
+# src / ssvep / MatveysScripts / ring_buffer.py
+
+"""
+Summary:
+
+Fixed-size sliding window over the rows streamed by a BrainFlow board.
+New samples are written in place, so the live plots only touch the samples
+that arrived since the last tick instead of re-fetching the whole window.
+"""
+
+import numpy as np
+
+
+# keeps the latest `size` samples of every row in a preallocated buffer
+class RingBuffer:
+    def __init__(self, num_rows: int, size: int, dtype=np.float64) -> None:
+        """
+        Every sample is stored twice (at idx and idx + size), so the latest
+        window is always the contiguous slice [write_idx, write_idx + size).
+
+        Args:
+            num_rows (int): number of rows (board channels) to keep
+            size (int): number of samples in the window
+            dtype (np.dtype, optional): sample type
+        """
+        self.size = size
+        self.buffer = np.zeros((num_rows, 2 * size), dtype=dtype)
+        self.write_idx = 0  # position the next sample is written to
+        self.count = 0  # number of valid samples (saturates at size)
+
+    # appends new samples (shape: [rows, n]), overwriting the oldest ones
+    def extend(self, new: np.ndarray) -> None:
+        n = new.shape[1]
+        if n == 0:
+            return
+        if n > self.size:
+            new = new[:, -self.size :]  # only the newest samples fit
+            n = self.size
+
+        # the samples land in at most two contiguous slices of each half, so plain slice
+        # assignments are enough (no index arrays, only the n new samples are touched)
+        start = self.write_idx
+        end = start + n  # < 2 * size since start < size and n <= size
+        self.buffer[:, start:end] = new
+        head = min(end, self.size) - start  # samples written before the midpoint
+        self.buffer[:, start + self.size : start + self.size + head] = new[:, :head]
+        if end > self.size:
+            self.buffer[:, : end - self.size] = new[:, head:]  # mirror of the wrapped tail
+
+        self.write_idx = end % self.size
+        self.count = min(self.count + n, self.size)
+
+    def is_full(self) -> bool:
+        return self.count == self.size
+
+    # latest window in chronological order (shape: [rows, size]), a view without copying
+    def window(self) -> np.ndarray:
+        return self.buffer[:, self.write_idx : self.write_idx + self.size]
@@ -1,10 +1,12 @@
 import argparse
 import logging
 import time
+import numpy as np
 import pyqtgraph as pg
 from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
 from brainflow.data_filter import DataFilter, FilterTypes, DetrendOperations
 from pyqtgraph.Qt import QtGui, QtCore
+from ring_buffer import RingBuffer
 
 
 class Graph:
@@ -16,13 +18,18 @@ class Graph:
         self.update_speed_ms = 50
         self.window_size = 4
         self.num_points = self.window_size * self.sampling_rate
+        self.x_axis = np.arange(self.num_points, dtype=np.float64)
+        # only new samples are pulled from the board, the filters work on a preallocated copy of the window
+        self.ring = RingBuffer(len(self.exg_channels), self.num_points)
+        self.filtered = np.empty((len(self.exg_channels), self.num_points))
 
-        self.app = QtGui.QApplication([])
+        self.app = pg.mkQApp()
         self.win = pg.GraphicsWindow(title='BrainFlow Plot', size=(800, 600))
 
         self._init_timeseries()
 
         timer = QtCore.QTimer()
+        timer.setTimerType(QtCore.Qt.PreciseTimer)
         timer.timeout.connect(self.update)
         timer.start(self.update_speed_ms)
         QtGui.QApplication.instance().exec_()
@@ -43,18 +50,26 @@ class Graph:
             self.curves.append(curve)
 
     def update(self):
-        data = self.board_shim.get_current_board_data(self.num_points)
-        for count, channel in enumerate(self.exg_channels):
-            DataFilter.detrend(data[channel], DetrendOperations.CONSTANT.value)
-            DataFilter.perform_bandpass(data[channel], self.sampling_rate, 3.0, 45.0, 2,
-                                        FilterTypes.BUTTERWORTH_ZERO_PHASE, 0)
-            DataFilter.perform_bandstop(data[channel], self.sampling_rate, 48.0, 52.0, 2,
-                                        FilterTypes.BUTTERWORTH_ZERO_PHASE, 0)
-            DataFilter.perform_bandstop(data[channel], self.sampling_rate, 58.0, 62.0, 2,
-                                        FilterTypes.BUTTERWORTH_ZERO_PHASE, 0)
-            self.curves[count].setData(data[channel].tolist())
-
-        self.app.processEvents()
+        self.ring.extend(self.board_shim.get_board_data()[self.exg_channels])
+        num_samples = self.ring.count
+        if num_samples == 0:
+            return
+        # BrainFlow filters in place on contiguous float64 rows, so the window is copied into
+        # the preallocated buffer (keeping the ring raw) and each row is handed over as a view
+        data = self.filtered[:, :num_samples]
+        np.copyto(data, self.ring.window()[:, -num_samples:])
+        for count, row in enumerate(data):
+            self._filter_channel(row)
+            self.curves[count].setData(self.x_axis[:row.size], row)
+
+    def _filter_channel(self, row):
+        DataFilter.detrend(row, DetrendOperations.CONSTANT.value)
+        DataFilter.perform_bandpass(row, self.sampling_rate, 3.0, 45.0, 2,
+                                    FilterTypes.BUTTERWORTH_ZERO_PHASE, 0)
+        DataFilter.perform_bandstop(row, self.sampling_rate, 48.0, 52.0, 2,
+                                    FilterTypes.BUTTERWORTH_ZERO_PHASE, 0)
+        DataFilter.perform_bandstop(row, self.sampling_rate, 58.0, 62.0, 2,
+                                    FilterTypes.BUTTERWORTH_ZERO_PHASE, 0)
 
 
 def main():
@@ -78,7 +93,8 @@ def main():
         for channel in channels:
             board_shim.config_board(f"chon_{channel}_{gain_value}")
             print(f"Configured channel {channel} with gain {gain_value}")
-            time.sleep(2.5)  # Brief delay for each channel configuration
+            time.sleep(0.05)  # Brief gap between channel configuration commands
+        time.sleep(0.2)  # Single settle delay once every channel is configured
 
         Graph(board_shim)
 
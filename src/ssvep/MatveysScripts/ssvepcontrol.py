@@ -1,62 +1,58 @@
 import sys
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFont, QPainter, QSurfaceFormat
+from PyQt5.QtWidgets import QApplication, QOpenGLWidget
 
 # Frequency list in Hz
 frequencies = [6.66, 8.57, 10, 12, 15, ]
 frequency_index = 0
 
 
-class FlashingWindow(QMainWindow):
+class FlashingWindow(QOpenGLWidget):
     def __init__(self):
         super().__init__()
         self.setWindowFlag(Qt.FramelessWindowHint)
         self.setWindowFlag(Qt.WindowStaysOnTopHint)
         self.setWindowState(Qt.WindowFullScreen)
 
-        self.current_color = Qt.black
+        self.is_white = False  # Current color, starts black
+        self.frame = 0  # Displayed frames within the current on/off cycle
         self.current_frequency = frequencies[frequency_index]
 
-        # Main layout
-        layout = QVBoxLayout()
-        layout.setAlignment(Qt.AlignBottom)
+        # Frequency display font, the text is drawn at the bottom of the screen
+        self.frequency_font = QFont()
+        self.frequency_font.setPixelSize(48)
 
-        # Frequency display label at the bottom
-        self.frequency_label = QLabel(f"{self.current_frequency} Hz", self)
-        self.frequency_label.setStyleSheet("color: black; font-size: 48px;")
-        self.frequency_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(self.frequency_label)
-
-        # Set up central widget and layout
-        central_widget = QWidget()
-        central_widget.setLayout(layout)
-        self.setCentralWidget(central_widget)
-
-        # Timer for flashing
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.toggle_color)
+        # Flashing is driven by the display: frameSwapped fires after every (vsync'd) buffer swap
+        self.frameSwapped.connect(self.next_frame)
         self.update_timer()
 
     def update_timer(self):
-        # Update label at the bottom of the screen with the current frequency
-        self.frequency_label.setText(f"{self.current_frequency} Hz")
+        # Update the number of displayed frames in one full cycle (black to white) based on the
+        # frequency, as in ConfigurableFlasher-v2.py, so odd-length cycles are possible too
+        refresh_rate = QApplication.primaryScreen().refreshRate()
+        self.cycle_frames = max(2, round(refresh_rate / self.current_frequency))
+        self.frame = 0
 
-        # Update timer interval based on the frequency
-        interval = 1000 / (
-            self.current_frequency * 2
-        )  # 2 toggles per cycle (black to white)
-        self.timer.start(interval)
+        # Update label at the bottom of the screen with the preset and the rate actually shown
+        self.frequency_text = (
+            f"{self.current_frequency} Hz ({refresh_rate / self.cycle_frames:.2f} Hz)"
+        )
 
-    def toggle_color(self):
-        # Toggle between black and white and update frequency display color
-        if self.current_color == Qt.black:
-            self.current_color = Qt.white
-            self.setStyleSheet("background-color: white;")
-            self.frequency_label.setStyleSheet("color: black; font-size: 48px;")
-        else:
-            self.current_color = Qt.black
-            self.setStyleSheet("background-color: black;")
-            self.frequency_label.setStyleSheet("color: white; font-size: 48px;")
+    def next_frame(self):
+        # White for the second half of each cycle (the shorter half for odd-length cycles)
+        self.frame = (self.frame + 1) % self.cycle_frames
+        self.is_white = (self.frame * 2 // self.cycle_frames) % 2 == 1
+        self.update()  # Request the next frame
+
+    def paintGL(self):
+        # Clear to the current color and draw the frequency in the opposite color
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white if self.is_white else Qt.black)
+        painter.setPen(Qt.black if self.is_white else Qt.white)
+        painter.setFont(self.frequency_font)
+        painter.drawText(self.rect(), Qt.AlignHCenter | Qt.AlignBottom, self.frequency_text)
+        painter.end()
 
     def keyPressEvent(self, event):
         global frequency_index
@@ -68,6 +64,11 @@ class FlashingWindow(QMainWindow):
 
 
 if __name__ == "__main__":
+    # Lock buffer swaps to the display refresh, this must be set before the app is created
+    surface_format = QSurfaceFormat()
+    surface_format.setSwapInterval(1)
+    QSurfaceFormat.setDefaultFormat(surface_format)
+
     app = QApplication(sys.argv)
     window = FlashingWindow()
     window.show()
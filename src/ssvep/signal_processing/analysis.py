@@ -12,12 +12,48 @@ Commenter(s): Ivan Costa Neto
 Last Updated: Nov. 15, 2024
 """
 
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import numpy as np
+from scipy import linalg, signal
+
+logger = logging.getLogger(__name__)  # debug output of the analysis, silent by default
+
+# the CCA runs in single precision, float32 is plenty for ranking canonical correlations
+CCA_DTYPE = np.float32
+
+# relative ridge added to a covariance that is not positive definite (e.g. EEG after CAR),
+# large enough to still register in float32
+REG_COEF = 10 * np.finfo(np.float32).eps
+
+# half-width (Hz) of the spectral band summed around each stimulation frequency by the SNR pre-screen
+SNR_BANDWIDTH = 0.2
+
+# worker threads for the filter-bank sub-bands of fbcca_analysis, each one already runs
+# multithreaded BLAS, so a few workers are enough for the handful of sub-bands
+SUB_BAND_WORKERS = 4
+
+# shared by every FoCAA instance, threads start on first use and are joined at interpreter exit
+_sub_band_pool = ThreadPoolExecutor(max_workers=SUB_BAND_WORKERS, thread_name_prefix="fbcca")
+
+
+# identity matrices are built once per (size, dtype), the channel count is fixed within a session
+@lru_cache(maxsize=None)
+def _eye(n: int, dtype: type = CCA_DTYPE) -> np.ndarray:
+    eye = np.eye(n, dtype=dtype)
+    eye.flags.writeable = False  # shared between calls, must not be modified in place
+    return eye
 
-# Canonical Correlation Analysis (CCA) implementation from the scikit-learn library
-# finds linear relationships b/w two datasets by projecting them into a shared space where the correlation is maximized
-from sklearn.cross_decomposition import CCA
-from scipy import signal
+
+# lower Cholesky factor of a covariance matrix, regularized only when the plain factorization fails
+def _cholesky(cov: np.ndarray) -> np.ndarray:
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        ridge = REG_COEF * np.trace(cov) / cov.shape[0]
+        return np.linalg.cholesky(cov + ridge * _eye(cov.shape[0], cov.dtype.type))
 
 
 # class: Frequency-Optimized Canonical Correlation Analysis with K-Nearest Neighbors
@@ -30,6 +66,7 @@ class FoCAA:
         frequencies: list,
         sampling_rate: int,
         cca_buffer_size: int,
+        snr_threshold: float = None,
     ) -> None:
         """
         Args:
@@ -37,63 +74,116 @@ class FoCAA:
             frequencies (list): List of target frequencies (Hz) for SSVEP detection.
             sampling_rate (int): Sampling rate of EEG data (Hz).
             cca_buffer_size (int): Length of EEG data buffer (number of samples).
+            snr_threshold (float, optional): Minimum SNR of the best target frequency for the
+                CCA to be worth running (see prescreen). None disables the pre-screen.
         """
         self.n_components = n_components
         self.sampling_rate = sampling_rate
         self.cca_buffer_size = cca_buffer_size
+        self.snr_threshold = snr_threshold
+        self._sos_cache = {}  # filter designs (second-order sections) reused by filtering, see _get_sos
 
-        # generate reference signals for each frequency
-        self.reference_signals = []  # list to store reference signals
+        # generate the sine/cosine reference signals of every frequency at once
+        # (shape: [# of frequencies, 6, length])
+        self.reference_signals = self.get_reference_signals(cca_buffer_size, frequencies)
+        # print("init: ", self.reference_signals.shape)
 
-        # iterates through every frequency
-        for frequency in frequencies:
-            # generate sine/cosine signals for the given frequency
-            self.reference_signals.append(
-                self.get_reference_signals(cca_buffer_size, frequency)
-            )
+        # references laid out once as contiguous [samples, refs] matrices per frequency
+        # (shape: [# of frequencies, length, 6]), so the per-tick loops don't re-transpose them
+        self.reference_signals_T = np.ascontiguousarray(
+            self.reference_signals.transpose(0, 2, 1)
+        )
 
-        self.reference_signals = np.array(self.reference_signals)  # converts to ndarray
-        # print("init: ", self.reference_signals.shape)
+        # the references never change, so they are centered and whitened once here:
+        # Yc @ Ly^-T (Ly: Cholesky factor of their covariance) has identity covariance, which
+        # leaves only the EEG side to whiten online. The frequencies are laid side by side
+        # (shape: [length, # of frequencies * 6]), so one GEMM covers all of them
+        # (in double precision, then stored as CCA_DTYPE for the online math)
+        ref_centered = self.reference_signals_T - self.reference_signals_T.mean(
+            axis=1, keepdims=True
+        )
+        ref_chol = np.array(
+            [_cholesky(yc.T @ yc / (yc.shape[0] - 1)) for yc in ref_centered]
+        )
+        ref_whitened = ref_centered @ np.linalg.inv(ref_chol).transpose(0, 2, 1)  # batched over frequencies
+        self.ref_whitened = np.ascontiguousarray(
+            ref_whitened.transpose(1, 0, 2).reshape(cca_buffer_size, -1), dtype=CCA_DTYPE
+        )
 
-    # gets reference signals (sine/cosine waves) for the given target frequency
+        # spectral bins around the fundamental and 2nd harmonic of every frequency, as
+        # [# of frequencies, bins] weights so the SNR of all frequencies is one matmul
+        bin_freqs = np.fft.rfftfreq(cca_buffer_size, d=1 / sampling_rate)
+        targets = np.asarray(frequencies, dtype=np.float64)[:, np.newaxis] * np.arange(1, 3)
+        self.snr_bands = (
+            np.abs(bin_freqs - targets[..., np.newaxis]) <= SNR_BANDWIDTH
+        ).sum(axis=1, dtype=np.float64)
+
+    # gets reference signals (sine/cosine waves) for the given target frequency (or frequencies)
     def get_reference_signals(self, length, target_freq) -> np.ndarray:
         """
-        Only signals with first (fundamental) and second harmonics of each of the frequencies.
+        Signals with the first (fundamental), second and third harmonics of the frequency.
 
         Args:
             length (int): length of data needed -> # of samples
-            target_freq (float): target frequency
+            target_freq (float or list): target frequency, or a list of them (broadcast at once)
 
         Returns:
-            reference_signals (np.ndarray): array of reference signals including harmonics (shape: [4, length])
+            reference_signals (np.ndarray): array of reference signals including harmonics
+                (shape: [6, length], or [# of frequencies, 6, length] for a list)
         """
-        reference_signals = []  # list to store individual reference signals
         # create a time vector from 0 --> duration of signal
-        t = np.arange(
-            0, (length / (self.sampling_rate)), step=(1.0 / (self.sampling_rate))
-        )
-        # print(t)
+        t = np.arange(length, dtype=np.float64) / self.sampling_rate
+        freqs = np.asarray(target_freq, dtype=np.float64)[..., np.newaxis, np.newaxis]
 
-        # first (fundamental) frequency components
-        reference_signals.append(np.sin(2 * np.pi * target_freq * t))  # sine wave
-        reference_signals.append(np.cos(2 * np.pi * target_freq * t))  # cosine wave
+        # phase of every harmonic (x1, x2, x3 target frequency) at once (shape: [..., 3, length])
+        harmonics = np.arange(1, 4)[:, np.newaxis] * (2 * np.pi * freqs * t)
 
-        # second frequency components (x2 target frequency)
-        reference_signals.append(np.sin(4 * np.pi * target_freq * t))  # sine wave
-        reference_signals.append(np.cos(4 * np.pi * target_freq * t))  # cosine wave
+        # sine and cosine wave of each harmonic, interleaved: sin(f), cos(f), sin(2f), ...
+        # (written straight into the output rows, no temporaries)
+        reference_signals = np.empty(harmonics.shape[:-2] + (2 * harmonics.shape[-2], length))
+        np.sin(harmonics, out=reference_signals[..., 0::2, :])
+        np.cos(harmonics, out=reference_signals[..., 1::2, :])
+
+        # return a numpy array of shape (6, length) per frequency
+        return reference_signals
 
-        # third frequency components (x3 target frequency)
-        reference_signals.append(np.sin(6 * np.pi * target_freq * t))  # sine wave
-        reference_signals.append(np.cos(6 * np.pi * target_freq * t))  # cosine wave
+    # estimates the SSVEP signal-to-noise ratio of each target frequency from the power spectrum
+    def snr(self, data: np.ndarray) -> np.ndarray:
+        """
+        Power around the fundamental and 2nd harmonic of each frequency (summed over
+        channels), relative to the median power of the spectrum (the noise floor).
 
-        reference_signals = np.array(reference_signals)
+        Args:
+            data (np.ndarray): EEG data (shape: [samples, channels])
 
-        # return a numpy array of shape (4, length)
-        return reference_signals
+        Returns:
+            snr (np.ndarray): SNR of each target frequency (shape: [# of frequencies])
+        """
+        # one real FFT per channel, then the power of all channels per bin
+        spectrum = np.fft.rfft(data - data.mean(axis=0), axis=0)
+        power = np.sum(spectrum.real**2 + spectrum.imag**2, axis=1)
+
+        return self.snr_bands @ power / np.median(power)
+
+    # cheap gate in front of the CCA: False when no target frequency stands out of the noise
+    def prescreen(self, data: np.ndarray) -> bool:
+        """
+        Args:
+            data (np.ndarray): EEG data (shape: [samples, channels])
+
+        Returns:
+            attended (bool): whether the CCA should be run on the data
+        """
+        if self.snr_threshold is None:
+            return True
+        return bool(np.max(self.snr(data)) >= self.snr_threshold)
 
     # computes canonical correlations using CCA for each reference signal
     def sk_findCorr(self, n_components: int, data: np.ndarray) -> np.ndarray:
         """
+        Closed-form CCA through cca_analysis (no iterative solver), keeping only
+        the largest canonical correlation of each frequency.
+
         Args:
             n_components (int): number of canonical components to compute
             data (np.ndarray): consists of the EEG, rows -> data, columns -> channels
@@ -101,38 +191,8 @@ class FoCAA:
         Returns:
             result (np.ndarray): array of maximum canonical correlations for each frequency
         """
-        # print("data: ", data.shape)
-
-        cca = CCA(n_components)  # initialize cca
-        corr = np.zeros(n_components)  # stores correlations for each component
-        result = np.zeros(
-            (self.reference_signals.shape)[0]
-        )  # correlations for each frequency
-
-        # iterates through each reference signal (one per frequency)
-        for freqIdx in range(0, (self.reference_signals.shape)[0]):
-            # print(
-            #     f"ref_{freqIdx}:",
-            #     np.squeeze(self.reference_signals[freqIdx, :, :]).T.shape,
-            # )
-            # print(np.squeeze(freq[freqIdx, :, :]).T)
-
-            ref_signal = np.squeeze(
-                self.reference_signals[freqIdx, :, :]
-            ).T  # extract reference signals
-            cca.fit(data, ref_signal)  # fit EEG data and reference signals
-            O1_a, O1_b = cca.transform(
-                data, ref_signal
-            )  # transforms datasets into canonical space
-
-            # compute correlations for each canonical component
-            for indVal in range(n_components):
-                corr[indVal] = np.corrcoef(O1_a[:, indVal], O1_b[:, indVal])[0, 1]
-                # print(np.corrcoef(O1_a[:, indVal], O1_b[:, indVal]))
-            result[freqIdx] = np.max(corr)  # maximum correlation for the frequency
-
-        # print(result)
-        return result
+        # the singular values come sorted (descending), so the first one is the maximum correlation
+        return self.cca_analysis(data)[:, 0]
 
     def focca_analysis(self, data: np.ndarray, a: list, b: list):
         num_harmonic = 2
@@ -141,31 +201,29 @@ class FoCAA:
             1, min(data.shape[1], num_harmonic * 2) + 1, dtype=float
         )  # Create the array k
 
-        coeff = np.zeros(self.reference_signals.shape[0])
-        print("+" * 100)
-        for val_a in a:
-            for val_b in b:
-                phi = np.power(k, -val_a) + val_b  # Compute phi
-
-                # for i in range(data.shape[-1]):  # Loop through all Trials
-                for ind in range(
-                    self.reference_signals.shape[0]
-                ):  # Calculate CCA for frequencies stimulation
-                    cano_corr = self.cca_analysis(
-                        data,
-                        data_ref=np.squeeze(self.reference_signals[ind, :, :]).T,
-                    )
-                    coeff[ind] = np.sum(
-                        phi * (cano_corr**2), axis=0
-                    )  # Calculate the coefficient coeff(L)
-
-                print(f"val_a = {val_a}, val_b = {val_b} --> {coeff}")
-
-                # predict_label[i] = np.argmax(
-                #     coeff
-                # )  # Predict label for the current trial
-        print("+" * 100)
-        return coeff
+        # Calculate CCA for all frequencies stimulation at once, it doesn't depend on (a, b)
+        cano_corrs = self.cca_analysis(data)
+
+        # Compute phi of every (a, b) pair at once (shape: [len(a), len(b), len(k)])
+        phi_grid = (
+            np.power(k, -np.asarray(a, dtype=float)[:, np.newaxis, np.newaxis])
+            + np.asarray(b, dtype=float)[np.newaxis, :, np.newaxis]
+        )
+
+        # Calculate the coefficient coeff(L) of every (a, b) pair and frequency in one contraction
+        # (shape: [len(a), len(b), # of frequencies])
+        coeff_grid = np.einsum("abk,fk->abf", phi_grid, cano_corrs**2)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for ind_a, ind_b in np.ndindex(coeff_grid.shape[:2]):
+                logger.debug(
+                    "val_a = %s, val_b = %s --> %s", a[ind_a], b[ind_b], coeff_grid[ind_a, ind_b]
+                )
+
+        # predict_label[i] = np.argmax(
+        #     coeff
+        # )  # Predict label for the current trial
+        return coeff_grid[-1, -1]  # coefficients of the last (a, b) pair
 
     def fbcca_analysis(
         self,
@@ -186,141 +244,128 @@ class FoCAA:
             1, np.array(filter_banks).shape[-1] + 1, dtype=float
         )  # Create the array k
 
-        # coeff = np.zeros(self.reference_signals.shape[0])
-        coeff = np.zeros((len([*filter_banks][0]), self.reference_signals.shape[0]))
-        # print("+" * 100)
+        # the sub-band correlations don't depend on (a, b): every sub-band is filtered and
+        # run through the CCA once, in parallel (filtfilt and the BLAS/LAPACK calls release the GIL)
+        def sub_band_coeff(bounds):
+            val_sb1, val_sb2 = bounds
+            data_sub_banks = self.filtering(
+                data,
+                val_sb1,
+                val_sb2,
+                order,
+                self.sampling_rate,
+                notch_freq,
+                quality_factor,
+                filter_active,
+                notch_filter,
+                type_filter,
+            )
+            # Calculate CCA for all frequencies stimulation of the sub-band at once
+            # (only the largest canonical correlation is used, the first one as they come sorted)
+            return self.cca_analysis(data_sub_banks)[:, 0]
+
+        # Calculate the coefficient coeff(L) (shape: [# of sub-bands, # of frequencies])
+        coeff = np.array(list(_sub_band_pool.map(sub_band_coeff, zip(*filter_banks))))
+        n_sub_bands = coeff.shape[0]
+
         labels = []
+        for ind_ab, (val_a, val_b) in enumerate((va, vb) for va in a for vb in b):
+            phi = np.power(k, -val_a) + val_b  # Compute phi
+            weighted = phi[:, np.newaxis] * coeff**2
+
+            if ind_ab == 0:
+                # the first (a, b) votes once per sub-band with the sub-bands seen so far
+                labels.extend(np.argmax(np.cumsum(weighted, axis=0), axis=1))
+            else:
+                # later ones vote once per sub-band with all of them
+                labels.extend([np.argmax(np.sum(weighted, axis=0))] * n_sub_bands)
+            c = np.sum(weighted, axis=0)
 
-        for val_a in a:
-            for val_b in b:
-                phi = np.power(k, -val_a) + val_b  # Compute phi
-
-                # for i in range(data.shape[-1]):  # Loop through all Trials
-                for ind_sb, (val_sb1, val_sb2) in enumerate(zip(*filter_banks)):
-                    data_sub_banks = self.filtering(
-                        data,
-                        val_sb1,
-                        val_sb2,
-                        order,
-                        self.sampling_rate,
-                        notch_freq,
-                        quality_factor,
-                        filter_active,
-                        notch_filter,
-                        type_filter,
-                    )
-                    for ind_fstim in range(
-                        self.reference_signals.shape[0]
-                    ):  # Calculate CCA for frequencies stimulation
-                        cano_corr = self.cca_analysis(
-                            data_sub_banks,
-                            data_ref=np.squeeze(
-                                self.reference_signals[ind_fstim, :, :]
-                            ).T,
-                        )
-                        # Calculate the coefficient coeff(L)
-                        coeff[ind_sb, ind_fstim] = np.max(cano_corr)
-
-                    label = np.argmax(np.sum(phi * (coeff**2).T, axis=1))
-                    c = np.sum(phi * (coeff**2).T, axis=1)
-                    labels.append(label)
-                # print(f"val_a = {val_a}, val_b = {val_b} --> {coeff}")
-
-                # predict_label[i] = np.argmax(
-                #     coeff
-                # )  # Predict label for the current trial
-        # print("+" * 100)
         labels = np.array(labels)
         label = np.bincount(labels).argmax()
         return c, label
 
     # performs CCA-based analysis for SSVEP classification
-    def cca_analysis(self, data: np.ndarray, data_ref: np.ndarray):
+    def cca_analysis(self, data: np.ndarray, data_ref: np.ndarray = None):
         """
         Args:
             data (np.ndarray): EEG data (shape: [# of samples, # of channels]).
+            data_ref (np.ndarray, optional): reference signals (shape: [# of samples, # of refs]).
+                If None, the references of every frequency are used and the EEG covariance
+                is computed only once for all of them.
 
         Returns:
-            np.ndarray: Canonical correlation coefficients for each frequency.
+            np.ndarray: Canonical correlation coefficients (shape: [n] for data_ref, else [# of frequencies, n]).
         """
-        # combine the data and reference data based on their dimensionality
-        # result = (
-        #     []
-        # )  # will store the canonical correlation coefficients for all frequencies
-
-        # for freqIdx in range(self.reference_signals.shape[0]):
-        # data_ref = np.squeeze(
-        #     self.reference_signals[freqIdx, :, :]
-        # ).T  # extract reference signals
-
-        # combine EEG data and reference signals for covariance computation
-        xy = (
-            np.concatenate((data, data_ref), axis=1)
-            if data.shape[1] <= data_ref.shape[1]
-            else np.concatenate((data_ref, data), axis=1)
+        if data_ref is None:
+            # centered and whitened references of every frequency are precomputed in __init__
+            refs = self.ref_whitened
+            n_refs = self.reference_signals.shape[1]
+        else:
+            data_ref = np.asarray(data_ref, dtype=CCA_DTYPE)
+            yc = data_ref - data_ref.mean(axis=0)  # centered reference signals
+            ly = _cholesky(yc.T @ yc / (yc.shape[0] - 1))
+            refs = linalg.solve_triangular(ly, yc.T, lower=True).T  # Yc @ Ly^-T
+            n_refs = refs.shape[1]
+
+        data = np.asarray(data, dtype=CCA_DTYPE)
+
+        # the EEG covariance and its Cholesky factor are the same for every frequency
+        n_samples = data.shape[0]
+        xc = data - data.mean(axis=0)  # centered EEG
+        cx = xc.T @ xc / (n_samples - 1)  # covariance of EEG data
+        lx = _cholesky(cx)
+        lx_inv = linalg.solve_triangular(
+            lx, _eye(lx.shape[0]), lower=True
         )
 
-        # calculate covariance matrices
-        covariance = np.cov(xy, rowvar=False)
-
         n = min(
-            data.shape[1], data_ref.shape[1]
+            data.shape[1], n_refs
         )  # minimum dimension (channels vs. references)
-        cx = covariance[:n, :n]  # covariance of EEG data
-        cy = covariance[n:, n:]  # covariance of reference signals
-        cxy = covariance[:n, n:]  # cross-covariance
-        cyx = covariance[n:, :n]  # transposed cross-covariance
-
-        # Solve the optimization problem using eigenvalue decomposition
-        eps = np.finfo(np.float32).eps  # small value to prevent singular matrices
-        # try:
-        if np.linalg.det(cx) != 0 and np.linalg.det(cy) != 0:
-            cx_inv = np.linalg.inv(cx)
-            cy_inv = np.linalg.inv(cy)
-        else:
-            # print("Taking changed version of cx and cy...")
-            coef = 10 ** (-5)
-            cx_inv = np.linalg.inv(cx + coef * eps * np.eye(cx.shape[0]))
-            cy_inv = np.linalg.inv(cy + coef * eps * np.eye(cy.shape[0]))
-        corr_coef = cy_inv @ cyx @ cx_inv @ cxy
-        # except Exception as e:
-        #     print("*" * 100)
-        #     print(f"Exception was triggered. Values:\n cx = {cx}")
-        #     print("full thing: \n", cx + eps * np.eye(cx.shape[0]))
-        #     print("Dtype cx: ", cx.dtype)
-        #     print("Dtype cy: ", cy.dtype)
-        #     print(
-        #         "Determinant of original cx: ",
-        #         np.linalg.det(cx),
-        #     )
-        #     print(
-        #         "Determinant of updated cx: ",
-        #         np.linalg.det(cx + coef * eps * np.eye(cx.shape[0])),
-        #     )
-        #     print("*" * 100)
-        #     raise e
-
-        # eigenvalue decomposition and sorting
-        eig_vals = np.linalg.eigvals(corr_coef)
-
-        # compute eigenvalues and canonical correlations
-        eig_vals = np.linalg.eigvals(corr_coef)  # solve for eigenvalues
-        eig_vals[eig_vals < 0] = 0  # set small negative values to zero
-        d_coeff = np.sqrt(
-            np.sort(np.real(eig_vals))[::-1]
-        )  # square root of eigenvalues
-
-        # result.append(
-        #     d_coeff[:n]
-        # )  # append top canonical correlations for this frequency
-
-        # result = np.array(result)
-
-        return d_coeff[:n]  # return results for all frequencies
-
-        # return d_coeff[:n]  # Return the canonical correlations
+
+        # cross-covariances with the whitened references of all frequencies in a single GEMM
+        # (shape: [channels, # of frequencies * refs]), i.e. Cxy @ Ly^-T side by side
+        cxy = xc.T @ refs / (n_samples - 1)
+
+        # whiten the EEG side too (one more GEMM): Lx^-1 @ Cxy @ Ly^-T,
+        # then split per frequency (shape: [# of frequencies, channels, refs])
+        k = (lx_inv @ cxy).reshape(cxy.shape[0], -1, n_refs).transpose(1, 0, 2)
+
+        # the singular values are the canonical correlations (already sorted, descending),
+        # one batched SVD for all frequencies instead of a Python loop
+        result = np.linalg.svd(k, compute_uv=False)[:, :n]
+
+        return result if data_ref is None else result[0]
 
     # ============================================= Filtering ====================================================
+    # Function to design a filter as second-order sections, once per configuration
+    def _get_sos(self, type_filter, f_low, f_high, order, fs):
+        """
+        The filter banks and the notch are fixed for a session, so each design is
+        computed on first use and then reused from self._sos_cache.
+        Inputs:
+        - type_filter: 'low', 'high', 'bandpass', 'bandstop' or 'notch'.
+        - f_low, f_high: Normalized cutoff frequencies (notch: frequency in Hz and quality factor).
+        - order: Filter order (unused for the notch).
+        - fs: Sampling frequency.
+        Output:
+        - sos: Second-order sections of the filter (None for an unknown type).
+        """
+        key = (type_filter, f_low, f_high, order, fs)
+        if key not in self._sos_cache:
+            if type_filter == "low":
+                sos = signal.butter(order, f_low, btype="low", output="sos")
+            elif type_filter == "high":
+                sos = signal.butter(order, f_high, btype="high", output="sos")
+            elif type_filter in ("bandpass", "bandstop"):
+                sos = signal.butter(order, [f_low, f_high], btype=type_filter, output="sos")
+            elif type_filter == "notch":
+                sos = signal.tf2sos(*signal.iirnotch(f_low, f_high, fs))
+            else:
+                sos = None
+            self._sos_cache[key] = sos
+        return self._sos_cache[key]
+
     # Function to apply digital filtering to data
     def filtering(
         self,
@@ -357,16 +402,16 @@ class FoCAA:
             - Transpose the data using permute to make channels as slices
             b. If it has more columns than rows:
             - Transpose the data to make channels as rows
-        3. Design Butterworth filter based on the specified type:
+        3. Design (or reuse the cached) Butterworth filter based on the specified type:
             - Lowpass filter: Design Butterworth filter with 'low' option
             - Highpass filter: Design Butterworth filter with 'high' option
             - Bandpass filter: Design Butterworth filter with 'bandpass' option
             - Bandstop filter: Design Butterworth filter with 'bandstop' option
-        4. Design a notch filter:
+        4. Design (or reuse the cached) notch filter:
             - Use iirnotch to design a notch filter based on notch frequency and quality factor
         5. Notch filter:
             - Apply notch filtering if notch_filter is 'on'
-        6. Apply the digital filter using filtfilt:
+        6. Apply the digital filter using sosfiltfilt:
             - Apply filtering if filter_active is 'on'
         7. Output the filtered data (filtered_data)
         End
@@ -376,13 +421,9 @@ class FoCAA:
         f_low = f_low / (fs / 2)
         f_high = f_high / (fs / 2)
 
-        filtered_data = data.copy()  # Make a copy of the input data
         # ---------------------------- Convert data to ndarray if it's not already -------------------------------
-        filtered_data = (
-            np.array(filtered_data)
-            if not isinstance(filtered_data, np.ndarray)
-            else filtered_data
-        )
+        # (no copy: the filters below return new arrays and never modify the input)
+        filtered_data = np.asarray(data)
         # ----------------------- Transpose data if it has more rows than columns --------------------------------
         filtered_data = (
             filtered_data.T
@@ -390,37 +431,17 @@ class FoCAA:
             and filtered_data.shape[0] > filtered_data.shape[-1]
             else filtered_data
         )
-        # ----------------------- Design Butterworth filter based on the specified type --------------------------
-        if type_filter == "low":
-            b, a = signal.butter(order, f_low, btype="low")
-        elif type_filter == "high":
-            b, a = signal.butter(order, f_high, btype="high")
-        elif type_filter == "bandpass":
-            b, a = signal.butter(order, [f_low, f_high], btype="bandpass")
-        elif type_filter == "bandstop":
-            b, a = signal.butter(order, [f_low, f_high], btype="bandstop")
-
-        # Design a notch filter using signal.iirnotch
-        # b_notch, a_notch = signal.butter(3, np.array([notch_freq - 0.4, notch_freq + 0.4])/fs/2, btype='bandstop')
-        b_notch, a_notch = signal.iirnotch(notch_freq, quality_factor, fs)
         # -------------------------------------------- Notch filter ----------------------------------------------
+        # (sosfiltfilt filters along the last axis, so 3D data is handled in a single call)
+        # b_notch, a_notch = signal.butter(3, np.array([notch_freq - 0.4, notch_freq + 0.4])/fs/2, btype='bandstop')
         if notch_filter == "on":
-            if filtered_data.ndim == 3:
-                for i in range(filtered_data.shape[0]):
-                    filtered_data[i, :, :] = signal.filtfilt(
-                        b_notch, a_notch, filtered_data[i, :, :]
-                    )
-            else:
-                filtered_data = signal.filtfilt(b_notch, a_notch, filtered_data)
-        # ---------------- Apply the digital filter using filtfilt to avoid phase distortion --------------------
+            sos_notch = self._get_sos("notch", notch_freq, quality_factor, None, fs)
+            filtered_data = signal.sosfiltfilt(sos_notch, filtered_data)
+        # ---------------- Apply the digital filter using sosfiltfilt to avoid phase distortion -----------------
+        # (Butterworth filter of the specified type, cached design)
         if filter_active == "on":
-            if filtered_data.ndim == 3:
-                for i in range(filtered_data.shape[0]):
-                    filtered_data[i, :, :] = signal.filtfilt(
-                        b, a, filtered_data[i, :, :]
-                    )
-            else:
-                filtered_data = signal.filtfilt(b, a, filtered_data)
+            sos = self._get_sos(type_filter, f_low, f_high, order, fs)
+            filtered_data = signal.sosfiltfilt(sos, filtered_data)
         # ----------------------------- Transpose data if it has more columns than rows --------------------------------
         filtered_data = (
             filtered_data.T
@@ -23,9 +23,13 @@ class KNN:
         self.y = labels
 
     def prepare_features(self, X):
-        X = [np.concatenate(features) for features in X]
-        X = np.array(X)
-        return X
+        # Flatten every sample's feature groups straight into one preallocated (samples, features) array
+        X = list(X)
+        n_features = sum(np.size(group) for group in X[0]) if X else 0
+        out = np.empty((len(X), n_features))
+        for row, features in zip(out, X):
+            np.concatenate(features, out=row)
+        return out
 
     def split_data(self, X, y):
         # 70% training, 15% validation, 15% testing
@@ -76,9 +80,10 @@ class KNN:
         joblib.dump(knn, f'knn_model_{datetime.now().strftime(r"%Y%m%d-%H%M")}.pkl')
 
     def load_model(self, filename):
-        knn = joblib.load(filename)
+        # Memory-map the fitted arrays (training samples, tree) instead of reading them into new buffers
+        knn = joblib.load(filename, mmap_mode="r")
         return knn
 
     def load_scaler(self, filename):
-        scaler = joblib.load(filename)
+        scaler = joblib.load(filename, mmap_mode="r")
         return scaler
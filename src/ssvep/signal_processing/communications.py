@@ -1,6 +1,11 @@
+import logging
 import socket
 import threading
 
+logger = logging.getLogger(__name__)
+
+RECV_BUFFER_SIZE = 65536  # Size of the preallocated receive buffer (bytes)
+
 class SocketServer:
     def __init__(self, host="127.0.0.1", port=65432):
         self.host = host
@@ -11,6 +16,7 @@ class SocketServer:
         self.running = False  # Indicates if the server is running
         self.client_connected = False  # Indicates if a client is connected
         self.lock = threading.Lock()  # For thread safety
+        self.recv_buffer = bytearray(RECV_BUFFER_SIZE)  # Reused by every read, no per-read allocation
 
     def start_server(self):
         """Starts the server and waits for a connection."""
@@ -20,6 +26,8 @@ class SocketServer:
         print("Server is listening...")
         self.connection, self.address = self.server_socket.accept()
         print(f"Connected to {self.address}")
+        # Commands are a few bytes each, send them right away instead of waiting for Nagle's algorithm
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.client_connected = True  # Client is connected
         # Start the receive thread after connection is established
         receive_thread = threading.Thread(target=self.receive)
@@ -27,13 +35,14 @@ class SocketServer:
 
     def receive(self):
         """Continuously listens for messages from the client."""
+        view = memoryview(self.recv_buffer)
         while self.client_connected:
             try:
                 if self.connection:
-                    data = self.connection.recv(1024)
-                    if data:
-                        message = data.decode()
-                        print(f"Received: {message}")
+                    n_bytes = self.connection.recv_into(view)
+                    if n_bytes:
+                        message = str(view[:n_bytes], "utf-8")
+                        logger.debug("Received: %s", message)
                     else:
                         print("No data received. Closing connection.")
                         self.client_connected = False
@@ -49,11 +58,11 @@ class SocketServer:
             if self.connection and self.client_connected:
                 try:
                     self.connection.sendall(message.encode())
-                    print(f"Sent: {message}")
+                    logger.debug("Sent: %s", message)
                 except Exception as e:
-                    print(f"Error sending message: {e}")
+                    logger.warning("Error sending message: %s", e)
             else:
-                print("No client connected. Cannot send message.")
+                logger.warning("No client connected. Cannot send message.")
 
     def close_connection(self):
         """Closes the server connection."""
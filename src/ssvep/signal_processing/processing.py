@@ -12,13 +12,28 @@ Commenter(s): Ivan Costa Neto
 Last Updated: Nov. 15, 2024
 """
 
+from functools import lru_cache
+
 import numpy as np
-from brainflow.data_filter import (
-    DataFilter,
-    FilterTypes,
-    DetrendOperations,
-    WindowOperations,
-)
+from scipy import signal
+from brainflow.data_filter import DataFilter, WindowOperations
+
+
+# designs the preprocessing filters as second-order sections, chained into a single cascade
+# (zero-phase when applied with sosfiltfilt, one forward-backward pass for all of them);
+# cached, so every DataProcessor with the same sampling rate shares one design
+@lru_cache(maxsize=None)
+def _design_sos(sampling_rate: int) -> np.ndarray:
+    sos = np.vstack([
+        # bandpass filter (5.5-35 Hz) to isolate EEG frequencies of interest
+        signal.butter(2, [5.5, 35.0], btype="bandpass", fs=sampling_rate, output="sos"),
+        # removes 0-5 Hz (BrainFlow's 0-5 Hz bandstop is a 5 Hz highpass, scipy needs edges > 0)
+        signal.butter(2, 5.0, btype="highpass", fs=sampling_rate, output="sos"),
+        # bandstop (notch) filters to remove powerline noise at 48 Hz to 62 Hz
+        signal.butter(2, [48.0, 52.0], btype="bandstop", fs=sampling_rate, output="sos"),
+        signal.butter(2, [58.0, 62.0], btype="bandstop", fs=sampling_rate, output="sos"),
+    ])
+    return sos  # shared between instances (left writeable, scipy's sosfilt rejects read-only sections)
 
 
 #  initializes the DataProcessor with the given sampling rate
@@ -31,6 +46,9 @@ class DataProcessor:
         self.sampling_rate = sampling_rate
         self.frequencies = frequencies
 
+        # preprocessing filter cascade, designed once per sampling rate (see _design_sos)
+        self.sos_filter = _design_sos(sampling_rate)
+
     # preprocesses EEG data by detrending, filtering, and applying CAR
     def process_data(self, data: np.ndarray) -> np.ndarray:
         """
@@ -40,57 +58,17 @@ class DataProcessor:
         Returns:
             data (np.ndarray): preprocessed EEG data (shape: [samples, channels])
         """
-        for i in range(0, data.shape[0]):  # loop through each EEG channel
-            # detrend to remove linear drifts (DC offset)
-            DataFilter.detrend(data[i], DetrendOperations.CONSTANT.value)
-
-            # bandpass filter (6-40 Hz) to isolate EEG frequencies of interest
-            DataFilter.perform_bandpass(
-                data=data[i],
-                sampling_rate=self.sampling_rate,
-                start_freq=5.5,
-                stop_freq=35.0,
-                order=2,
-                filter_type=FilterTypes.BUTTERWORTH_ZERO_PHASE.value,  # minimal phase distortion
-                ripple=0,
-            )
+        # detrend to remove linear drifts (DC offset), all channels at once
+        data = data - data.mean(axis=1, keepdims=True)
 
-            # bandstop (notch) filters to remove powerline noise at 48 Hz to 62 Hz
-            DataFilter.perform_bandstop(
-                data=data[i],
-                sampling_rate=self.sampling_rate,
-                start_freq=0.0,
-                stop_freq=5.0,
-                order=2,
-                filter_type=FilterTypes.BUTTERWORTH_ZERO_PHASE.value,
-                ripple=0,
-            )
-            DataFilter.perform_bandstop(
-                data=data[i],
-                sampling_rate=self.sampling_rate,
-                start_freq=48.0,
-                stop_freq=52.0,
-                order=2,
-                filter_type=FilterTypes.BUTTERWORTH_ZERO_PHASE.value,
-                ripple=0,
-            )
-            DataFilter.perform_bandstop(
-                data=data[i],
-                sampling_rate=self.sampling_rate,
-                start_freq=58.0,
-                stop_freq=62.0,
-                order=2,
-                filter_type=FilterTypes.BUTTERWORTH_ZERO_PHASE.value,
-                ripple=0,
-            )
-
-        # transpose data to make it [samples, channels] for further processing
-        data = data.T
+        # bandpass, low-frequency and powerline stops in a single zero-phase pass over all channels
+        data = signal.sosfiltfilt(self.sos_filter, data, axis=1)
 
-        # apply Common Average Referencing (CAR)
-        data = self.car(data)
+        # apply Common Average Referencing (CAR, as in car()) in place, the filtered buffer is our own
+        data -= data.mean(axis=0, keepdims=True)
 
-        return data
+        # transpose data to make it [samples, channels] for further processing
+        return data.T
 
     # computes the Common Average Reference (CAR) for EEG signals
     def car(self, data: np.ndarray, reference_channel: int = None) -> np.ndarray:
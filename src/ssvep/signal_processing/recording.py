@@ -21,18 +21,24 @@ from datetime import datetime
 
 # import pandas as pd
 
+# file buffer of the CSV recordings (bytes): rows are written to disk in batches of this size
+# instead of every few rows with the default 8 KiB, small enough to lose little data on a crash
+RECORD_BUFFER_SIZE = 1 << 16
+
 
 # initializes a CSV writer for recording data
 def initialize_writer(
     file_name: str,
     header: str,
     mode: str = "w",
+    buffering: int = RECORD_BUFFER_SIZE,
 ) -> tuple["_csv._writer", IO]:
     """
     Args:
         file_name (str): base name of the file (without extension)
         header (str): list of column names for the CSV file
         mode (str, optional): file write mode
+        buffering (int, optional): size of the file buffer in bytes (flushed when full and on close)
 
     Returns:
         writer, csv_file (tuple["_csv._writer", IO]): a tuple containing the CSV writer object and the file object
@@ -40,7 +46,7 @@ def initialize_writer(
     # timestamp to the file name for uniqueness
     file_name = file_name + "_" + datetime.now().strftime(r"%Y%m%d-%H%M") + ".csv"
     # open the file in the specified mode ('w' for overwrite)
-    csv_file = open(file_name, mode=mode, newline="")
+    csv_file = open(file_name, mode=mode, newline="", buffering=buffering)
     # create a CSV writer object
     writer = csv.writer(csv_file)
     # write the header row to the CSV
@@ -52,7 +58,7 @@ def initialize_writer(
 def uninitialize_writer(csv_file) -> None:
     """
     Args:
-        csv_file (IO): the file object to close
+        csv_file (IO): the file object to close (its buffered rows are flushed first)
     """
     csv_file.close()
 
@@ -88,7 +94,9 @@ def record_cca_data(
         time: Timestamp of the recorded data.
     """
     # appends the metadata (stimuli state, frequency, timestamp) to the CCA coefficients
-    data = np.append(cca_coefs, [stimuli, frequency, time])
+    # (built as a plain list, the csv writer iterates it anyway; floats keep the previous CSV format)
+    data = np.asarray(cca_coefs, dtype=np.float64).tolist()
+    data += [float(stimuli), float(frequency), float(time)]
     writer.writerow(data)  # write a single row of data
 
 
@@ -13,6 +13,7 @@ Last Updated: Nov. 15, 2024
 """
 
 import time
+import logging
 import numpy as np
 import signal
 import serial.tools.list_ports
@@ -27,6 +28,8 @@ from communications import SocketServer
 from ui import UI  # Import the UI class
 from qasync import QEventLoop  # Import QEventLoop for integrating PyQt and asyncio
 
+logger = logging.getLogger(__name__)  # per-tick results are logged, not printed
+
 
 class SSVEPAnalyzer:
 
@@ -73,6 +76,7 @@ class SSVEPAnalyzer:
         self.buffer_size = 450000
         self.cca_buffer_size = 500
         self.n_components = 1
+        self.snr_threshold = None  # SNR pre-screen in front of the CCA, None always runs the CCA
         self._run = True
 
         # Initialize the data queue
@@ -159,6 +163,7 @@ class SSVEPAnalyzer:
             self.frequencies,
             self.sampling_rate,
             self.cca_buffer_size,
+            self.snr_threshold,
         )
 
         # Wait until sufficient data is available
@@ -249,6 +254,7 @@ class SSVEPAnalyzer:
             self.frequencies,
             self.sampling_rate,
             self.cca_buffer_size,
+            self.snr_threshold,
         )
         data_processor = DataProcessor(self.sampling_rate, self.frequencies)
 
@@ -300,7 +306,16 @@ class SSVEPAnalyzer:
             data = data1 if self.turn == 1 else data2
 
             # process the EEG data (filtering, detrending, CAR)
-            data = data_processor.process_data(data)
+            # (the heavy steps run in a worker thread, so the UI and socket keep running meanwhile)
+            data = await asyncio.to_thread(data_processor.process_data, data)
+
+            # skip the CCA (and any command) while no stimulus stands out of the noise
+            if not focca_knn.prescreen(data):
+                logger.debug("SNR below threshold, CCA skipped")
+                # still refresh the UI plots, without a command
+                await self.data_queue.put({"timestamp": t_stamp, "eeg_data": data.tolist()})
+                await asyncio.sleep(1)
+                continue
 
             psd_values = data_processor.get_PSD_values(data.T)
 
@@ -311,7 +326,7 @@ class SSVEPAnalyzer:
             #     writer=eeg_writer, data=data, samp_timestamps=samp_timestamps
             # )
 
-            # perform SSVEP classification using sklearn-based CCA
+            # perform SSVEP classification using closed-form CCA
             sk_result = focca_knn.sk_findCorr(self.n_components, data)
 
             # record CCA results with metadata
@@ -324,7 +339,6 @@ class SSVEPAnalyzer:
             #     time=t_stamp,
             # )
 
-            print("=" * 100)
             # print("Sklearn CCA Result:", sk_result)
 
             # custom_result = []
@@ -338,7 +352,8 @@ class SSVEPAnalyzer:
             # perform custom CCA analysis (manual implementation)
             # custom_result_focca = focca_knn.focca_analysis(data=data, a=a, b=b)
 
-            custom_result_fbcca, predicted_label_fbcca = focca_knn.fbcca_analysis(
+            custom_result_fbcca, predicted_label_fbcca = await asyncio.to_thread(
+                focca_knn.fbcca_analysis,
                 data=data,
                 a=a,
                 b=b,
@@ -359,7 +374,7 @@ class SSVEPAnalyzer:
             #     time=t_stamp,
             # )
 
-            print("Custom FBCCA coeff:", custom_result_fbcca)
+            logger.debug("Custom FBCCA coeff: %s", custom_result_fbcca)
             # print("Custom FoCCA Result:", custom_result_focca)
 
             # determine the predicted frequency class
@@ -369,14 +384,12 @@ class SSVEPAnalyzer:
             #     "Sklearn CCA prediction freq: ",
             #     self.frequencies[sklearn_predictedClass],
             # )
-            print("Custom FBCCA prediction: ", predicted_label_fbcca)
-            print(
-                "Custom FBCCA prediction freq: ",
+            logger.info(
+                "Custom FBCCA prediction: %s (%s Hz)",
+                predicted_label_fbcca,
                 self.frequencies[predicted_label_fbcca],
             )
 
-            print("=" * 100)
-
             data_for_KNN = np.array([custom_result_fbcca, psd_values])
 
             data_for_csv = np.concatenate(data_for_KNN)
@@ -485,6 +498,8 @@ if __name__ == "__main__":
 
     # enable BrainFlow debug logging
     BoardShim.enable_dev_board_logger()
+    # predictions are logged at INFO, switch to DEBUG to also see the per-tick coefficients
+    logging.basicConfig(level=logging.INFO)
 
     # set up connection parameters for the EEG board
     params_1 = BrainFlowInputParams()